@@ -4,47 +4,230 @@
 # Runs INSIDE OpenPLC. The `psm` module is provided by OpenPLC.
 #
 # Scan-cycle responsibilities:
-# 1) update_inputs():  read /tmp/input.json and push values into OpenPLC
+# 1) update_inputs():  take the latest input JSON and push values into OpenPLC
 #                      (e.g., set %IX0.0 from JSON)
-# 2) update_outputs(): read OpenPLC outputs (e.g., %QX0.0) and mirror them
-#                      to /tmp/output.json for the output bridge to publish
+# 2) update_outputs(): read OpenPLC outputs (e.g., %QX0.0), publish them and
+#                      mirror them to /tmp/output.json
+#
+# IO_TRANSPORT selects where inputs come from and where outputs go:
+# - "mqtt": this process talks to the broker itself (plc/input → queue → scan,
+#           scan → plc/output). No bridges needed; output.json is a debug view.
+# - "file": classic setup, /tmp/input.json and /tmp/output.json are exchanged
+#           with mqtt_input_bridge.py / mqtt_output_bridge.py.
+# - "shm":  the bridges stay separate processes, but input/output bits are
+#           exchanged through a shared-memory segment (no JSON, no files) and
+#           a named semaphore wakes the output bridge on every change.
 #
 # Key format convention:
-# - JSON keys include the leading '%' (e.g. "%IX0.0", "%QX0.1")
+# - Input JSON keys include the leading '%' (e.g. "%IX0.0", "%IX0.1")
 # - When calling psm.set_var / psm.get_var, we remove the '%' because the PSM
 #   API expects names like "IX0.0" and "QX0.0".
+# - Outputs are packed into a bitmap: bit i of "bits" (hex) is OUTPUT_VARS[i],
+#   and "schema" identifies that ordering (e.g. {"bits":"1","schema":"c45dea3b"}).
 #
 # Important: This file is not executed like a normal Python script in your shell.
 # Paste it into the OpenPLC Web UI under "Hardware" → "Python SubModule".
 # ===========================
 
 import psm                                   # OpenPLC-provided API inside PSM: start/stop loop, set_var/get_var, should_quit
-import time                                  # Used to sleep between PSM scan cycles
-import json                                  # Used to read inputs and write outputs as JSON
-import os                                    # Used to check if the input file exists
+import time                                  # Used to pace PSM scan cycles against a monotonic clock
+import orjson                                # Fast JSON serializer (bytes out) for writing outputs
+import os                                    # Used to stat the input file (exists? changed?), for raw-fd writes and atomic renames
 import tempfile                              # Used for atomic writes to output.json
+import zlib                                  # Used to fingerprint the OUTPUT_VARS ordering (schema id) once at import
+import queue                                 # SimpleQueue hands parsed MQTT inputs from Paho's thread to the scan loop
+import platform                              # Checks the CPU architecture before enabling the "shm" transport
+import struct                                # Packs/unpacks the u64 words of the shared-memory layout
+from multiprocessing import shared_memory, resource_tracker  # POSIX shared memory segment shared with the bridges ("shm")
 
 INPUT_PATH = "/tmp/input.json"               # File written by mqtt_input_bridge.py with desired input states
 OUTPUT_PATH = "/tmp/output.json"             # File we (the PSM) write with current PLC outputs
+SCAN_PERIOD_SEC = 0.1                        # Target scan period (100 ms is a common choice)
+
+IO_TRANSPORT = "mqtt"                        # "mqtt" (talk to the broker directly), "file" or "shm" (go through the two bridges)
+MQTT_HOST = "localhost"                      # MQTT broker host (your Docker Mosquitto runs here)
+MQTT_PORT = 1883                             # Standard MQTT port
+MQTT_INPUT_TOPIC = "plc/input"               # Topic we receive input updates on
+MQTT_OUTPUT_TOPIC = "plc/output"             # Topic we publish output snapshots to
+
+# Shared-memory layout ("shm" transport). MUST MATCH the bridges. Six little-endian u64 words:
+#   [in_seq][in_bits][in_schema][out_seq][out_bits][out_schema]
+# *_seq is a seqlock counter (odd while the single writer is mid-update), *_bits is bit i = *_VARS[i],
+# *_schema is the CRC32 of the comma-joined *_VARS so each side can detect a mismatched list.
+# Bitmaps are 64 bits wide, so this transport supports up to 64 boolean inputs and 64 outputs.
+# x86 only: the seqlock relies on stores becoming visible in program order (x86-TSO). struct.pack_into
+# is a plain memcpy with no memory barrier, so on weakly ordered CPUs (ARM, e.g. Raspberry Pi) a reader
+# could accept stale bits under a new seq. Use "mqtt" or "file" there.
+SHM_NAME = "plc_io"                          # Segment name (/dev/shm/plc_io on Linux)
+SHM_SIZE = 4096                              # One page; the layout only uses the first 48 bytes
+SHM_OUTPUT_SEM = "/plc_io_out"               # Semaphore released after every output change
+_U64 = struct.Struct("<Q")                   # One layout word
+_IN_SEQ, _IN_BITS, _IN_SCHEMA, _OUT_SEQ, _OUT_BITS, _OUT_SCHEMA = range(0, 48, 8)  # Byte offsets of the words
+_SHM_MACHINES = {"x86_64", "amd64", "i386", "i686"}  # platform.machine() values with in-order store visibility
+
+# Define which inputs external JSON may set. Keys not listed here are ignored by update_inputs().
+INPUT_VARS = [
+    "IX0.0",
+    # "IX0.1", "IX0.2", ... extend this as your program grows
+    # ("mqtt"/"file" also pass word inputs such as "IW0" through; "shm" carries one bit per entry, so IX only)
+]
+_INPUT_NAMES = {f"%{addr}": addr for addr in INPUT_VARS}  # Allowed JSON key → PSM name ("%IX0.0" → "IX0.0"), built once
+_INPUT_KEY_MASKS = [(f"%{addr}", 1 << i) for i, addr in enumerate(INPUT_VARS)]  # ("shm") JSON key → bit in the input bitmap
+_INPUT_SCHEMA = zlib.crc32(",".join(INPUT_VARS).encode())  # ("shm") Input ordering id checked by the input bridge
 
 # Define which outputs you care to export. Add more as needed.
+# ORDER MATTERS: the position in this list is the bit position in the published bitmap.
+# Only boolean %QX outputs fit in a bitmap; word outputs such as "QW0" are rejected at import.
 OUTPUT_VARS = [
     "QX0.0",
-    # "QX0.1", "QX0.2", ... List of PLC outputs we export; extend this as your program grows
+    # "QX0.1", "QX0.2", ... List of PLC outputs we export; extend this as your program grows (append at the end)
 ]
+_SCHEMA_HASH = f"{zlib.crc32(','.join(OUTPUT_VARS).encode()):08x}"  # Schema id: changes whenever OUTPUT_VARS (or its order) changes
+
+_parser = None                               # simdjson Parser reused every scan ("file"; created in hardware_init so pysimdjson is only needed there)
+_JsonObject = None                           # simdjson's lazy JSON object type ("file")
+_last_input_stamp = None                     # (inode, mtime_ns, size) of the input.json we last applied; unchanged → skip re-reading
+_last_output_bits = None                     # Last output bitmap written to output.json; unchanged → skip the write
+_inbox = queue.SimpleQueue()                 # Parsed input payloads (dicts) pushed by the MQTT thread, drained each scan
+_client = None                               # Paho client when IO_TRANSPORT == "mqtt" (created in hardware_init)
+_MQTT_ERR_SUCCESS = None                     # Paho's "publish accepted" code (set with _client, so paho is only needed for "mqtt")
+_shm = None                                  # Shared-memory segment when IO_TRANSPORT == "shm" (created in hardware_init)
+_out_sem = None                              # Output-change semaphore when IO_TRANSPORT == "shm"
+_last_in_seq = 0                             # Input seqlock value we last applied (0 = bridge never wrote)
 
 
-def _atomic_write_json(path: str, obj: dict) -> None:         # Helper for safe writes to avoid partial files
+def _build_output_collector():                              # Specialize the output read for this exact OUTPUT_VARS list
+    """
+    OUTPUT_VARS is fixed for the life of the PSM, so generate a function with the loop
+    unrolled, e.g. for ["QX0.0", "QX0.1"]:
+        def _collect_output_bits(get_var):
+            return (0x1 if get_var('QX0.0') else 0) | (0x2 if get_var('QX0.1') else 0)
+    One expression per scan instead of a Python loop over (name, mask) pairs.
+    Raises ValueError for non-%QX names, which would otherwise be exported as 0/1.
+    """
+    words = [addr for addr in OUTPUT_VARS if not addr.startswith("QX")]  # Anything that isn't a single bit
+    if words:
+        raise ValueError(f"OUTPUT_VARS may only list boolean QX outputs, got {words}")
+    terms = [f"({1 << i:#x} if get_var({addr!r}) else 0)" for i, addr in enumerate(OUTPUT_VARS)]  # One term per bit
+    source = "def _collect_output_bits(get_var):\n    return " + (" | ".join(terms) or "0") + "\n"  # "0" if nothing exported
+    namespace = {}                                            # Isolated namespace for the generated code
+    exec(source, namespace)                                   # Compile it once, at import time
+    return namespace["_collect_output_bits"]
+
+
+_collect_output_bits = _build_output_collector()             # get_var → output bitmap (bit i = OUTPUT_VARS[i])
+
+
+def _atomic_write_json(path: str, obj: dict) -> None:  # Helper for safe writes to avoid partial files
+    """
+    Serialize `obj` as compact JSON (in the dict's insertion order) and write it with _atomic_write_bytes.
+    """
+    _atomic_write_bytes(path, orjson.dumps(obj))
+
+
+def _atomic_write_bytes(path: str, data: bytes) -> None:  # Write already-serialized bytes atomically
     """
     Same atomic write strategy as the bridges, to avoid partial reads by others.
+    The rename alone guarantees readers never see a torn file; there is no fsync,
+    since /tmp is RAM-backed and readers re-read the file on restart anyway.
     """
     directory = os.path.dirname(path) or "."                  # Get the directory of the destination path
-    with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as tf:  # Create a temp file in same dir
-        json.dump(obj, tf, separators=(",", ":"), sort_keys=True)             # Write JSON canonicalized
-        tf.flush()                                                            # Flush Python buffers
-        os.fsync(tf.fileno())                                                 # Ensure data is on disk
-        temp_name = tf.name                                                   # Remember temp file name
-    os.replace(temp_name, path)                                               # Atomically move temp → final path
+    fd, temp_name = tempfile.mkstemp(dir=directory)           # Create a temp file in same dir (random name, O_EXCL; raw fd, no Python buffering)
+    try:
+        os.write(fd, data)                                    # Plain write, no flush (the rename provides atomicity)
+    finally:
+        os.close(fd)                                          # Always release the descriptor
+    os.replace(temp_name, path)                               # Atomically move temp → final path
+
+
+def _on_connect(client, userdata, flags, reason_code, properties):  # Paho v2 callback, runs on Paho's network thread
+    global _last_output_bits                                # Forces a republish of the current outputs
+    print(f"[PSM] Connected to MQTT {MQTT_HOST}:{MQTT_PORT} reason={reason_code}")  # Log connection result
+    client.subscribe(MQTT_INPUT_TOPIC)                      # (Re)subscribe on every (re)connect
+    _last_output_bits = None                                # Next scan publishes the current snapshot to the new session
+
+
+def _on_message(client, userdata, msg):                     # Paho v2 callback for every message on plc/input
+    """
+    Parse the payload on Paho's thread and hand the dict to the scan loop.
+    No file, no set_var here: OpenPLC variables are only touched from the scan.
+    """
+    try:
+        data = orjson.loads(msg.payload)                    # Parse JSON bytes → Python dict
+    except orjson.JSONDecodeError:                          # Invalid JSON (or invalid UTF-8)
+        print("[PSM] Ignored MQTT payload: not valid JSON") # Tell the operator what happened
+        return
+    if not isinstance(data, dict):                          # Top-level JSON must be an object
+        print("[PSM] Ignored MQTT payload: JSON must be an object like {\"%IX0.0\": true}")  # Warn
+        return
+    _inbox.put(data)                                        # Thread-safe handoff to update_inputs()
+
+
+def _start_mqtt():                                          # Connect to the broker from inside the PSM process
+    """
+    Start Paho's background network thread. connect_async() means a broker that is
+    down doesn't block PSM startup; the loop keeps retrying in the background.
+    """
+    global _client, _MQTT_ERR_SUCCESS                       # Shared with update_outputs() and shutdown
+    import paho.mqtt.client as mqtt                         # Imported here: the "file"/"shm" transports don't need paho
+    _MQTT_ERR_SUCCESS = mqtt.MQTT_ERR_SUCCESS               # Used by update_outputs() to check each publish
+    _client = mqtt.Client(                                  # Create a Paho MQTT client instance
+        callback_api_version=mqtt.CallbackAPIVersion.VERSION2,  # Paho 2.x callback signatures
+        protocol=mqtt.MQTTv5,                               # Speak MQTT 5 to the broker
+    )
+    _client.on_connect = _on_connect                        # Handles (re)subscribe
+    _client.on_message = _on_message                        # Handles input payloads
+    _client.connect_async(MQTT_HOST, MQTT_PORT, keepalive=60)  # Non-blocking connect (keepalive sends heartbeats)
+    _client.loop_start()                                    # Background thread runs the network loop
+
+
+def _stop_mqtt():                                           # Clean MQTT shutdown when the PSM stops
+    if _client is not None:                                 # Only if we started one
+        _client.loop_stop()                                 # Stop the background network thread
+        _client.disconnect()                                # Disconnect from the broker
+
+
+def _open_shm():                                            # Create-or-attach the IO segment shared with the bridges
+    """
+    The segment is never unlinked, so the PSM and the bridges can each restart
+    independently and keep mapping the same memory.
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=SHM_NAME, create=True, size=SHM_SIZE)  # First one up creates it (zero-filled)
+    except FileExistsError:                                 # Left by an earlier run or created by a bridge
+        shm = shared_memory.SharedMemory(name=SHM_NAME)     # Attach to it
+    resource_tracker.unregister(shm._name, "shared_memory") # Stop Python from unlinking it when this process exits
+    return shm
+
+
+def _start_file():                                          # Set up the "file" transport
+    global _parser, _JsonObject                             # Used by _read_input_file()
+    from simdjson import Parser, Object                     # Imported here: OpenPLC's Python may not have pysimdjson otherwise
+    _parser = Parser()                                      # Reused every scan so simdjson keeps its internal buffers
+    _JsonObject = Object                                    # Type check for the parsed document
+
+
+def _start_shm():                                           # Set up the "shm" transport
+    global _shm, _out_sem                                   # Shared with update_inputs()/update_outputs()
+    if len(INPUT_VARS) > 64 or len(OUTPUT_VARS) > 64:       # The layout holds one u64 bitmap per direction
+        raise ValueError("IO_TRANSPORT 'shm' supports at most 64 INPUT_VARS and 64 OUTPUT_VARS")
+    words = [addr for addr in INPUT_VARS if not addr.startswith("IX")]  # Would be driven to True/False by the bitmap
+    if words:
+        raise ValueError(f"IO_TRANSPORT 'shm' only carries boolean IX inputs, got {words}")
+    if platform.machine().lower() not in _SHM_MACHINES:     # The seqlock has no memory barriers (see the layout notes)
+        raise ValueError(f"IO_TRANSPORT 'shm' requires an x86 CPU, not {platform.machine()}; use 'mqtt' or 'file'")
+    import posix_ipc                                        # Imported here: only this transport needs the semaphore package
+    _shm = _open_shm()                                      # Map the segment
+    _U64.pack_into(_shm.buf, _IN_SCHEMA, _INPUT_SCHEMA)     # Publish our input ordering for the input bridge to check
+    _U64.pack_into(_shm.buf, _OUT_SCHEMA, int(_SCHEMA_HASH, 16))  # Same id as the JSON "schema" field
+    _out_sem = posix_ipc.Semaphore(SHM_OUTPUT_SEM, posix_ipc.O_CREAT)  # Create-or-open the wakeup semaphore (starts at 0)
+
+
+def _stop_shm():                                            # Release our mapping when the PSM stops
+    if _shm is not None:                                    # Only if we opened one
+        _shm.close()                                        # Unmap (the segment itself stays for the bridges)
+    if _out_sem is not None:
+        _out_sem.close()                                    # Close our handle (the semaphore itself stays)
 
 
 def hardware_init():                                        # Called once when PSM starts (OpenPLC lifecycle hook)
@@ -52,70 +235,174 @@ def hardware_init():                                        # Called once when P
     Called once when PSM starts. Good place for any hardware init.
     """
     psm.start()                                             # Initialize PSM-side runtime
-    # Optional: write an empty outputs file so downstream tools don’t fail on first run
+    if IO_TRANSPORT == "mqtt":                              # Direct mode: no bridges in between
+        _start_mqtt()                                       # Start receiving plc/input in the background
+    elif IO_TRANSPORT == "shm":                             # Bridges exchange bits with us through shared memory
+        _start_shm()                                        # Map the segment and open the semaphore
+        return                                              # No output file in this mode
+    else:                                                   # Bridges exchange JSON files with us
+        _start_file()                                       # Load the input parser
+    # Optional: write an all-off snapshot so downstream tools don’t fail on first run
     try:                                                    # Try to create an initial outputs file
-        _atomic_write_json(OUTPUT_PATH, {})                 # Write an empty JSON object so readers don’t fail on startup
+        _atomic_write_json(OUTPUT_PATH, {"bits": "0", "schema": _SCHEMA_HASH})  # Valid snapshot (same shape as update_outputs)
     except Exception as e:                                  # If it fails, don’t crash the PSM
         print(f"[PSM] Init warning: could not pre-create {OUTPUT_PATH}: {e}")  # Log a warning
 
 
+def _drain_inbox():                                         # "mqtt" transport: collect everything received since the last scan
+    """
+    Merge all queued payloads (later messages win per key). Return the dict, or None if nothing arrived.
+    """
+    merged = None                                           # Nothing received yet
+    while True:                                             # Empty the queue without blocking
+        try:
+            data = _inbox.get_nowait()                      # Next payload from the MQTT thread
+        except queue.Empty:                                 # Queue drained
+            return merged
+        if merged is None:                                  # First payload this scan
+            merged = data                                   # Use it as-is (nobody else holds it)
+        else:                                               # More payloads arrived within one scan
+            merged.update(data)                             # Keep only the newest value per key
+
+
+def _read_input_file():                                     # "file" transport: read /tmp/input.json if the bridge replaced it
+    """
+    Return the lazily parsed JSON object, or None when the file is missing, unchanged or not an object.
+    """
+    global _last_input_stamp                                # Remembered across scans
+    try:                                                    # A single stat() answers both "does it exist?" and "did it change?"
+        st = os.stat(INPUT_PATH)                            # Look at the current input file
+    except FileNotFoundError:                               # If no input file yet, nothing to do this scan
+        return None                                         # Leave inputs as-is
+    stamp = (st.st_ino, st.st_mtime_ns, st.st_size)        # The bridge writes via rename, so every new write changes this stamp
+    if stamp == _last_input_stamp:                          # Same file we already applied → nothing new this scan
+        return None                                         # Inputs in OpenPLC are already up to date
+    _last_input_stamp = stamp                               # Mark as seen (a bad file is reported once, not every scan)
+
+    with open(INPUT_PATH, "rb") as f:                       # Open the input file produced by mqtt_input_bridge.py (bytes)
+        data = _parser.parse(f.read())                      # Lazily parse {"%IX0.0": true, ...}; no full dict is built
+
+    if not isinstance(data, _JsonObject):                   # Sanity check: ensure we got a JSON object
+        print("[PSM] update_inputs: ignoring non-object JSON")  # Warn and skip
+        return None
+    return data
+
+
+def _read_shm_inputs():                                     # "shm" transport: input bits written by the input bridge
+    """
+    Seqlock read: return {"%IX0.0": bool, ...} when the bridge published new bits since
+    the last scan, or None when nothing changed or the bridge is mid-update (retried next scan).
+    """
+    global _last_in_seq                                     # Remembered across scans
+    buf = _shm.buf                                          # Shared memory view
+    seq = _U64.unpack_from(buf, _IN_SEQ)[0]                 # Current input version
+    if seq == _last_in_seq or seq & 1:                      # Unchanged, or the bridge is writing right now
+        return None                                         # Nothing to apply this scan
+    bits = _U64.unpack_from(buf, _IN_BITS)[0]               # Read the bitmap...
+    if _U64.unpack_from(buf, _IN_SEQ)[0] != seq:            # ...and make sure it wasn't rewritten meanwhile
+        return None                                         # Torn read: try again next scan
+    _last_in_seq = seq                                      # This version is now applied
+    return {key: bool(bits & mask) for key, mask in _INPUT_KEY_MASKS}  # Same shape as the JSON inputs
+
+
+def _write_shm_outputs(bits: int) -> None:                  # "shm" transport: publish output bits to the output bridge
+    """
+    Seqlock write (we are the only writer), then wake the output bridge.
+    """
+    buf = _shm.buf                                          # Shared memory view
+    seq = _U64.unpack_from(buf, _OUT_SEQ)[0] | 1            # Odd = "write in progress" (also recovers from a crash mid-write)
+    _U64.pack_into(buf, _OUT_SEQ, seq)                      # Announce the write
+    _U64.pack_into(buf, _OUT_BITS, bits)                    # Store the new bitmap
+    _U64.pack_into(buf, _OUT_SEQ, seq + 1)                  # Even again = consistent
+    _out_sem.release()                                      # Wake the output bridge (no polling on its side)
+
+
 def update_inputs():                                        # Called each scan to bring external inputs into OpenPLC
     """
-    Read /tmp/input.json (if present) and set OpenPLC input variables.
+    Take the latest inputs (MQTT queue, shared memory or /tmp/input.json) and set OpenPLC input variables.
     Example JSON:
       {"%IX0.0": true, "%IX0.1": false}
-    We strip the leading '%' before calling psm.set_var("IX0.0", True).
+    Only keys listed in INPUT_VARS are applied; the leading '%' is dropped for psm.set_var("IX0.0", True).
+    Nothing is touched when no new input arrived since the last scan.
     """
     try:                                                    # Guard against IO/JSON errors
-        if not os.path.exists(INPUT_PATH):                  # If no input file yet, nothing to do this scan
+        if IO_TRANSPORT == "mqtt":                          # New inputs since last scan, if any...
+            data = _drain_inbox()                           # ...from the MQTT thread
+        elif IO_TRANSPORT == "shm":
+            data = _read_shm_inputs()                       # ...from shared memory
+        else:
+            data = _read_input_file()                       # ...from /tmp/input.json
+        if data is None:                                    # Nothing new
             return                                         # Leave inputs as-is
-        with open(INPUT_PATH, "r") as f:                    # Open the input file produced by mqtt_input_bridge.py
-            data = json.load(f)                             # Parse it as a dict: {"%IX0.0": true, ...}
-
-        if not isinstance(data, dict):                      # Sanity check: ensure we got a dict
-            print("[PSM] update_inputs: ignoring non-object JSON")  # Warn and skip
-            return
 
+        set_var = psm.set_var                               # Look the PSM setter up once, not once per key
         for key, value in data.items():                     # Iterate through each external input mapping
-            if not isinstance(key, str) or not key.startswith("%"):  # Only process keys like "%IX0.0"
-                continue                                    # Skip anything not in expected format
-            plc_name = key[1:]                              # Strip leading '%' → "IX0.0" as required by psm.set_var
-
-            # You can add filtering here, e.g., only set IX* vars
-            # But PSM allows setting any addressable var (IX, IW, QX, M, etc.)
-            psm.set_var(plc_name, value)                    # Tell OpenPLC to set that input variable to the provided value
+            plc_name = _INPUT_NAMES.get(key)                # One hash lookup: allowed? and its PSM name ("%IX0.0" → "IX0.0")
+            if plc_name is None:                            # Unknown or malformed key
+                continue                                    # Skip it
+            set_var(plc_name, value)                        # Tell OpenPLC to set that input variable to the provided value
 
     except Exception as e:                                  # Catch any exception so scans continue
         print(f"[PSM] Error in update_inputs: {e}")         # Log for debugging (visible in OpenPLC console)
 
 
-def update_outputs():                                       # Called each scan to mirror PLC outputs to JSON
+def update_outputs():                                       # Called each scan to publish/mirror PLC outputs as JSON
     """
-    Collect the desired OpenPLC outputs and mirror to /tmp/output.json.
-    Keys in JSON are written WITH the leading '%', to be consistent with input convention.
-    Example output:
-      {"%QX0.0": true}
+    Collect the desired OpenPLC outputs as a bitmap, publish it to plc/output ("mqtt"
+    transport) and mirror it to /tmp/output.json; with "shm" only the shared bitmap is updated.
+    Bit i is OUTPUT_VARS[i]; "schema" lets subscribers check they decode with the same list.
+    Example output (only %QX0.0 on):
+      {"bits": "1", "schema": "c45dea3b"}
+    Nothing is published or written unless at least one output bit changed.
     """
+    global _last_output_bits                                # Remembered across scans
     try:                                                    # Guard against IO errors
-        output = {}                                         # Collect output variables in a dict
-        for addr in OUTPUT_VARS:                            # For each output we want to export (e.g., "QX0.0")
-            val = psm.get_var(addr)                         # Read its current value from the PLC runtime
-            output[f"%{addr}"] = val                        # Store with a leading '%' to keep symmetry with inputs
-        _atomic_write_json(OUTPUT_PATH, output)             # Atomically write the outputs snapshot for downstream readers
+        bits = _collect_output_bits(psm.get_var)            # Read every exported output into the bitmap (unrolled, no loop)
+        if bits == _last_output_bits:                       # Nothing changed since the last write (a single int compare)
+            return                                         # Skip the file write entirely
+        if IO_TRANSPORT == "shm":                           # Shared memory: no JSON, no file
+            _write_shm_outputs(bits)                        # Store the bitmap and wake the output bridge
+        else:
+            # Canonical key order is "bits", then "schema": dicts keep insertion order, so no runtime
+            # sort is needed and the output bridge can compare the raw bytes as-is.
+            output = {"bits": f"{bits:x}", "schema": _SCHEMA_HASH}  # Compact snapshot: hex bitmap + ordering id
+            payload = orjson.dumps(output)                  # Serialize once for both MQTT and the file
+            if IO_TRANSPORT == "mqtt":                      # Direct mode: publish straight to the broker
+                info = _client.publish(MQTT_OUTPUT_TOPIC, payload, qos=0, retain=False)  # Send to plc/output
+                if info.rc != _MQTT_ERR_SUCCESS:            # Not connected (yet): keep the change pending
+                    return                                 # Retry on the next scan
+                _last_output_bits = bits                    # Sent: never republish it because of the debug view below
+                try:                                        # The file is only a debug view in this mode...
+                    _atomic_write_bytes(OUTPUT_PATH, payload)  # ...so mirror the snapshot there
+                except Exception as e:                      # ...and a failure must not affect what goes out on MQTT
+                    print(f"[PSM] Could not update debug view {OUTPUT_PATH}: {e}")  # Report it (once per output change)
+                return
+            _atomic_write_bytes(OUTPUT_PATH, payload)       # "file" mode: atomically write the snapshot for the output bridge
+        _last_output_bits = bits                            # Only remembered once the snapshot went out (retry next scan otherwise)
 
-    except Exception as e:                                  # Don’t crash PSM if file write fails
+    except Exception as e:                                  # Don’t crash PSM if publishing or the file write fails
         print(f"[PSM] Error in update_outputs: {e}")        # Log the error so we can diagnose
 
 
 if __name__ == "__main__":                                  # Standard entry point for the PSM module
     hardware_init()                                         # Initialize the hardware layer and create initial output file
+    next_tick = time.monotonic()                            # Absolute deadline of the next scan (immune to wall-clock jumps)
     while not psm.should_quit():                            # Main PSM loop; OpenPLC sets this flag when stopping
-        update_inputs()                                     # 1) Pull /tmp/input.json values into PLC (%IX*, etc.)
-        update_outputs()                                    # 2) Push PLC outputs (%QX*, etc.) to /tmp/output.json
-        time.sleep(0.1)                                     # 3) Pace the PSM scan loop (100 ms is a common choice)
+        update_inputs()                                     # 1) Pull new input values into PLC (%IX*, etc.)
+        update_outputs()                                    # 2) Push PLC outputs (%QX*, etc.) as a bitmap to plc/output and /tmp/output.json
+        next_tick += SCAN_PERIOD_SEC                        # 3) Pace the loop against deadlines so the scan body's runtime doesn't add drift
+        delay = next_tick - time.monotonic()                # Time left until the next deadline
+        if delay > 0:                                       # On schedule
+            time.sleep(delay)                               # Sleep only for what's left of this period
+        else:                                               # Overran (slow scan): don't try to catch up with back-to-back scans
+            next_tick = time.monotonic()                    # Re-anchor the schedule to now
+    _stop_mqtt()                                            # Disconnect from the broker (no-op unless "mqtt")
+    _stop_shm()                                             # Unmap shared memory (no-op unless "shm")
     psm.stop()                                              # Clean shutdown when OpenPLC requests termination
 
 # HOW THIS FILE RELATES TO THE OTHERS:
-# - CONSUMES /tmp/input.json written by mqtt_input_bridge.py (MQTT → file).
-# - PRODUCES /tmp/output.json which is published by mqtt_output_bridge.py (file → MQTT).
+# - IO_TRANSPORT = "mqtt": subscribes to plc/input and publishes plc/output itself; the bridges are not needed.
+# - IO_TRANSPORT = "file": CONSUMES /tmp/input.json written by mqtt_input_bridge.py (MQTT → file) and
+#   PRODUCES /tmp/output.json which is published by mqtt_output_bridge.py (file → MQTT).
+# - IO_TRANSPORT = "shm": same two bridges, but the bits travel through the "plc_io" shared-memory segment.
 # - This file is the glue that maps external JSON to OpenPLC variables and vice versa.
\ No newline at end of file
@@ -5,21 +5,51 @@ Listens on MQTT topic `plc/input`. Whenever a JSON payload arrives, we write it
 verbatim to /tmp/input.json. The PSM (hardware_layer.py inside OpenPLC) reads
 this file each scan and maps keys like "%IX0.0" to OpenPLC inputs.
 
+With IO_TRANSPORT = "shm" the payload is instead folded into the input bitmap
+of the PSM's shared-memory segment (bit i = INPUT_VARS[i]); no file is written.
+
 CONTRACT:
 - Expect messages to be valid JSON objects.
 - Keys should be OpenPLC-style locations **with a leading '%'**, e.g. "%IX0.0".
-  (The PSM strips '%' before calling psm.set_var("IX0.0", val).)
+  (The PSM ignores keys not in its INPUT_VARS and strips '%' before calling psm.set_var("IX0.0", val).)
 """
 
-import json                                   # Used to parse incoming MQTT payloads and write them to disk as JSON
+import logging                                # Used instead of print() so per-message logs can be filtered out cheaply
+import logging.handlers                       # QueueHandler/QueueListener: move the log IO off the MQTT thread
+import queue                                  # Queue shared by the QueueHandler and its listener thread
+import orjson                                 # Fast JSON parser/serializer used on incoming MQTT payloads and the file we write
 import os                                     # Used to get directory name for atomic writes
 import tempfile                               # Used to create a temp file for atomic writes (write-then-rename)
+import struct                                 # Packs/unpacks the u64 words of the shared-memory layout ("shm")
+import zlib                                   # Fingerprints INPUT_VARS so we can check it matches the PSM's ("shm")
+from multiprocessing import shared_memory, resource_tracker  # POSIX shared memory segment shared with the PSM ("shm")
 import paho.mqtt.client as mqtt               # Paho MQTT client library for connecting/subscribing to the broker
 
 MQTT_HOST = "localhost"                       # The MQTT broker host (your Docker Mosquitto runs here)
 MQTT_PORT = 1883                              # Standard MQTT port used by Mosquitto
 MQTT_TOPIC = "plc/input"                      # Topic this bridge listens on for input state updates
 INPUT_PATH = "/tmp/input.json"                # File the PSM reads each scan to set PLC inputs
+LOG_LEVEL = logging.INFO                      # Set to logging.DEBUG to log every payload written
+IO_TRANSPORT = "file"                         # "file" (/tmp/input.json) or "shm" (shared memory); must match the PSM
+
+# "shm" only: MUST MATCH the PSM's INPUT_VARS (same order). Bit i of the input bitmap is INPUT_VARS[i],
+# so only boolean %IX inputs can be listed (the PSM refuses anything else).
+INPUT_VARS = [
+    "IX0.0",
+]
+_INPUT_MASKS = {f"%{addr}": 1 << i for i, addr in enumerate(INPUT_VARS)}  # JSON key → bit mask, built once
+_INPUT_SCHEMA = zlib.crc32(",".join(INPUT_VARS).encode())  # Must equal the in_schema word the PSM publishes
+
+# Shared-memory layout ("shm" transport). MUST MATCH the PSM. Six little-endian u64 words:
+#   [in_seq][in_bits][in_schema][out_seq][out_bits][out_schema]
+# x86 only (the seqlock has no memory barriers); the PSM refuses to start "shm" on other CPUs.
+SHM_NAME = "plc_io"                           # Segment name (/dev/shm/plc_io on Linux)
+SHM_SIZE = 4096                               # One page; the layout only uses the first 48 bytes
+_U64 = struct.Struct("<Q")                    # One layout word
+_IN_SEQ, _IN_BITS, _IN_SCHEMA, _OUT_SEQ, _OUT_BITS, _OUT_SCHEMA = range(0, 48, 8)  # Byte offsets of the words
+
+log = logging.getLogger("input-bridge")       # Logger for this bridge (name shows up as the "[input-bridge]" prefix)
+_shm = None                                   # Shared-memory segment when IO_TRANSPORT == "shm" (opened in main)
 
 def atomically_write_json(path: str, obj: dict) -> None:   # Helper to safely write JSON without partial files
     """
@@ -27,55 +57,119 @@ def atomically_write_json(path: str, obj: dict) -> None:   # Helper to safely wr
     We write to a temp file then rename, which is atomic on POSIX filesystems.
     """
     directory = os.path.dirname(path) or "."               # Determine directory where final file will live
-    with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as tf:  # Create a temp file in same dir
-        json.dump(obj, tf, separators=(",", ":"), sort_keys=True)             # Serialize JSON in canonical form
+    with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False) as tf:  # Create a temp file (binary) in same dir
+        tf.write(orjson.dumps(obj))                                            # Serialize compact JSON (the PSM detects changes by stat, not bytes)
         tf.flush()                                                            # Flush Python buffer to OS
         os.fsync(tf.fileno())                                                 # Ensure bytes hit disk to avoid loss
         temp_name = tf.name                                                   # Remember temp file name for rename
     os.replace(temp_name, path)                                               # Atomic rename to final path
 
 
-def on_connect(client, userdata, flags, rc):                  # Callback when MQTT connects/reconnects
-    print(f"[input-bridge] Connected to MQTT {MQTT_HOST}:{MQTT_PORT} rc={rc}")  # Log connection result
+def open_shm() -> shared_memory.SharedMemory:             # Create-or-attach the IO segment shared with the PSM ("shm")
+    """
+    The segment is never unlinked, so the PSM and the bridges can each restart
+    independently and keep mapping the same memory.
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=SHM_NAME, create=True, size=SHM_SIZE)  # First one up creates it (zero-filled)
+    except FileExistsError:                                 # Already created by the PSM or an earlier run
+        shm = shared_memory.SharedMemory(name=SHM_NAME)     # Attach to it
+    resource_tracker.unregister(shm._name, "shared_memory") # Stop Python from unlinking it when this process exits
+    return shm
+
+
+def write_shm_inputs(data: dict) -> None:                  # "shm": fold a JSON payload into the shared input bitmap
+    """
+    Keys not in INPUT_VARS are ignored; listed keys set (truthy) or clear their bit.
+    We are the only writer, so a seqlock (odd counter while writing) is enough for the PSM
+    to detect and skip a half-written update.
+    """
+    buf = _shm.buf                                            # Shared memory view
+    schema = _U64.unpack_from(buf, _IN_SCHEMA)[0]             # Ordering the PSM uses (0 until the PSM has started)
+    if schema and schema != _INPUT_SCHEMA:                    # Our INPUT_VARS would map keys to the wrong bits
+        log.error("INPUT_VARS does not match the PSM's; ignoring payload")  # Tell the operator
+        return
+    bits = _U64.unpack_from(buf, _IN_BITS)[0]                 # Current input bitmap (keys missing from data keep their value)
+    for key, value in data.items():                           # Apply each listed input
+        mask = _INPUT_MASKS.get(key)                          # Its bit, or None when not in INPUT_VARS
+        if mask is None:                                      # Unknown key
+            continue                                          # Skip it (same rule as the PSM)
+        bits = bits | mask if value else bits & ~mask         # Set or clear the bit
+    seq = _U64.unpack_from(buf, _IN_SEQ)[0] | 1               # Odd = "write in progress" (also recovers from a crash mid-write)
+    _U64.pack_into(buf, _IN_SEQ, seq)                         # Announce the write
+    _U64.pack_into(buf, _IN_BITS, bits)                       # Store the new bitmap
+    _U64.pack_into(buf, _IN_SEQ, seq + 1)                     # Even again = consistent; the PSM picks it up next scan
+
+
+def setup_logging() -> logging.handlers.QueueListener:     # Route all logging through a queue drained by a background thread
+    """
+    QueueHandler still formats each record on the calling thread; only the blocking
+    stderr write moves to the QueueListener thread. The main saving is that DEBUG
+    records (one per message) are dropped before formatting at LOG_LEVEL = INFO.
+    Returns the started listener; call .stop() on exit to flush pending records.
+    """
+    log_queue = queue.Queue(-1)                               # Unbounded queue: callers never block on logging
+    root = logging.getLogger()                                # Configure the root logger for the whole process
+    root.setLevel(LOG_LEVEL)                                  # Records below this level are dropped before formatting
+    root.addHandler(logging.handlers.QueueHandler(log_queue)) # Callers format the record and enqueue it
+    stream = logging.StreamHandler()                          # The listener thread writes to stderr
+    stream.setFormatter(logging.Formatter("[%(name)s] %(levelname)s: %(message)s"))  # Same "[bridge] ..." prefix as before
+    listener = logging.handlers.QueueListener(log_queue, stream)  # Background thread draining the queue
+    listener.start()                                          # Start it now
+    return listener
+
+
+def on_connect(client, userdata, flags, reason_code, properties):  # Callback when MQTT connects/reconnects (Paho v2 signature)
+    log.info("Connected to MQTT %s:%s reason=%s", MQTT_HOST, MQTT_PORT, reason_code)  # Log connection result
     client.subscribe(MQTT_TOPIC)                              # Subscribe to plc/input so we receive input updates
-    print(f"[input-bridge] Subscribed to {MQTT_TOPIC}")       # Log subscription for traceability
+    log.info("Subscribed to %s", MQTT_TOPIC)                  # Log subscription for traceability
 
 
 def on_message(client, userdata, msg):
     """
     Called for every message on plc/input.
-    We decode → parse JSON → write to /tmp/input.json.
+    We parse JSON → write to /tmp/input.json (or the shared input bitmap with "shm").
+    msg.payload (bytes) goes straight into orjson: no intermediate decoded str copy.
     """
     try:                                                      # Guard against bad data or IO errors
-        payload = msg.payload.decode("utf-8", errors="strict")  # Decode bytes → text (strict to catch bad UTF-8)
-        data = json.loads(payload)                            # Parse JSON text → Python dict
+        data = orjson.loads(msg.payload)                      # Parse JSON bytes → Python dict (orjson also rejects bad UTF-8)
 
         if not isinstance(data, dict):                        # Ensure top-level JSON is an object
-            print("[input-bridge] Ignored payload: JSON must be an object like {\"%IX0.0\": true}")  # Warn if not
+            log.warning("Ignored payload: JSON must be an object like {\"%IX0.0\": true}")  # Warn if not
             return                                            # Do nothing this round
 
-        # Optional: sanity check key format
-        bad_keys = [k for k in data if not isinstance(k, str) or not k.startswith("%")]  # Validate key format
-        if bad_keys:                                          # If some keys look wrong,
-            print(f"[input-bridge] WARNING: Keys should start with '%'. Offenders: {bad_keys}")  # Warn the user
-
+        if IO_TRANSPORT == "shm":                             # Shared memory: no file at all
+            write_shm_inputs(data)                            # Update the input bitmap for the PSM
+            log.debug("Wrote shared inputs: %s", data)        # Log what we wrote (formatted only when DEBUG is enabled)
+            return
 
+        # Key validation happens in the PSM (only keys from its INPUT_VARS are applied)
         atomically_write_json(INPUT_PATH, data)               # Write inputs atomically so PSM never reads half files
-        print(f"[input-bridge] Wrote {INPUT_PATH}: {data}")   # Log what we wrote to coordinate with PSM and Node-RED
+        log.debug("Wrote %s: %s", INPUT_PATH, data)           # Log what we wrote (formatted only when DEBUG is enabled)
 
-    except json.JSONDecodeError:                              # Specific parse error for invalid JSON
-        print("[input-bridge] ERROR: Payload is not valid JSON")  # Tell the operator what happened
+    except orjson.JSONDecodeError:                            # Specific parse error for invalid JSON (or invalid UTF-8)
+        log.error("Payload is not valid JSON")                # Tell the operator what happened
     except Exception as e:                                    # Catch-all for any other exception
-        print(f"[input-bridge] ERROR: {e}")                   # Log error details
+        log.error("%s", e)                                    # Log error details
 
 
 def main():                                                   # Entrypoint when running the script
-    client = mqtt.Client()                                    # Create a Paho MQTT client instance
+    global _shm                                               # Used by on_message
+    listener = setup_logging()                                # Start the background logging thread first
+    if IO_TRANSPORT == "shm":                                 # Map the segment before any message can arrive
+        _shm = open_shm()
+    client = mqtt.Client(                                     # Create a Paho MQTT client instance
+        callback_api_version=mqtt.CallbackAPIVersion.VERSION2,  # Paho 2.x callback signatures (reason codes + properties)
+        protocol=mqtt.MQTTv5,                                 # Speak MQTT 5 to the broker
+    )
     client.on_connect = on_connect                            # Register connection callback (handles subscribe)
     client.on_message = on_message                            # Register message callback (handles writes to file)
     client.connect(MQTT_HOST, MQTT_PORT, keepalive=60)        # Connect to the broker (keepalive sends heartbeats)
     # loop_forever() runs the network loop and blocks this process (intended)
-    client.loop_forever()                                     # Block here running the MQTT network loop
+    try:
+        client.loop_forever()                                 # Block here running the MQTT network loop
+    finally:
+        listener.stop()                                       # Flush any queued log records before exiting
 
 
 if __name__ == "__main__":                                    # Standard Python guard for script execution
@@ -83,6 +177,7 @@ if __name__ == "__main__":                                    # Standard Python
 
 
 # HOW THIS FILE RELATES TO THE OTHERS:
-# - Produces /tmp/input.json for the PSM driver (hardware_layer.py) to read each scan.
+# - Produces /tmp/input.json for the PSM driver (hardware_layer.py) to read each scan
+#   (or, with IO_TRANSPORT = "shm", the input bitmap in the "plc_io" shared-memory segment).
 # - The PSM sets PLC inputs via psm.set_var(...) so your ladder/ST logic uses the new values.
 # - The outputs of that logic are later written to /tmp/output.json by the PSM and then published by mqtt_output_bridge.py.
\ No newline at end of file
@@ -1,71 +1,255 @@
 """
 mqtt_output_bridge.py
 ---------------------
-Polls /tmp/output.json. If content changed since the last publish,
-publish the new JSON to MQTT topic `plc/output`.
+Watches /tmp/output.json (inotify, driven by the event loop). If content changed since
+the last publish, publish the file's bytes verbatim to MQTT topic `plc/output`.
+The PSM already writes compact JSON in a fixed key order ("bits", then "schema"),
+so we never parse or re-serialize it.
 
-We run client.loop_start() to keep the Paho MQTT connection alive (heartbeats)
-without blocking this file-watching loop.
+With IO_TRANSPORT = "shm" there is no file: we block on a named semaphore the PSM
+releases after every output change, read the bitmap from shared memory and publish
+the same {"bits": ..., "schema": ...} JSON the PSM would have written.
+
+Everything runs on one asyncio event loop: aiomqtt drives the MQTT socket
+(heartbeats, publishes) and the inotify file descriptor is registered on the same
+loop with add_reader, so there is no background thread and no timer: the process
+only wakes when the kernel reports a change in /tmp.
 """
 
-import json                                   # Used to parse output.json and to serialize for MQTT publishing
-import os                                     # Used to check if output.json exists and its size
-import time                                   # Used to poll output.json at a steady interval
-import paho.mqtt.client as mqtt               # Paho MQTT client library to publish updates to the broker
+import asyncio                                # Single event loop shared by the MQTT connection and the file watcher
+import contextlib                             # aclosing(): unregister the watcher when a connection ends
+import ctypes                                 # Calls libc's inotify_init1/inotify_add_watch (the stdlib has no inotify binding)
+import logging                                # Used instead of print() so per-publish logs can be filtered out cheaply
+import logging.handlers                       # QueueHandler/QueueListener: move the log IO off the hot path
+import os                                     # Used to resolve the watched directory and read inotify events
+import queue                                  # Queue shared by the QueueHandler and its listener thread
+import struct                                 # Packs/unpacks the u64 words of the shared-memory layout ("shm")
+from multiprocessing import shared_memory, resource_tracker  # POSIX shared memory segment shared with the PSM ("shm")
+import xxhash                                 # Fast (SIMD) non-cryptographic hash used to detect content changes
+import aiomqtt                                # asyncio MQTT client (wraps Paho) to publish updates to the broker
 
 MQTT_HOST = "localhost"                       # MQTT broker host (your Docker Mosquitto runs here)
 MQTT_PORT = 1883                              # Standard MQTT port
 MQTT_TOPIC = "plc/output"                     # Topic where we publish PLC output snapshots
 OUTPUT_PATH = "/tmp/output.json"              # File written by the PSM containing current outputs
-POLL_INTERVAL_SEC = 0.5                       # How often we check for changes in output.json
+RECONNECT_DELAY_SEC = 2                       # Wait before reconnecting after the broker connection drops
+SEM_WAIT_TIMEOUT_SEC = 1.0                    # ("shm") Max time a semaphore wait blocks its worker thread, so shutdown stays prompt
+LOG_LEVEL = logging.INFO                      # Set to logging.DEBUG to log every payload published
+IO_TRANSPORT = "file"                         # "file" (/tmp/output.json) or "shm" (shared memory); must match the PSM
+
+# Shared-memory layout ("shm" transport). MUST MATCH the PSM. Six little-endian u64 words:
+#   [in_seq][in_bits][in_schema][out_seq][out_bits][out_schema]
+# x86 only (the seqlock has no memory barriers); the PSM refuses to start "shm" on other CPUs.
+SHM_NAME = "plc_io"                           # Segment name (/dev/shm/plc_io on Linux)
+SHM_SIZE = 4096                               # One page; the layout only uses the first 48 bytes
+SHM_OUTPUT_SEM = "/plc_io_out"                # Semaphore the PSM releases after every output change
+_U64 = struct.Struct("<Q")                    # One layout word
+_IN_SEQ, _IN_BITS, _IN_SCHEMA, _OUT_SEQ, _OUT_BITS, _OUT_SCHEMA = range(0, 48, 8)  # Byte offsets of the words
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008                   # A file opened for writing was closed (in-place writers)
+IN_MOVED_TO = 0x00000080                      # A file was renamed into the directory (the PSM's atomic writes)
+_INOTIFY_EVENT = struct.Struct("iIII")        # struct inotify_event header: wd, mask, cookie, len (the name follows)
 
+log = logging.getLogger("output-bridge")      # Logger for this bridge (name shows up as the "[output-bridge]" prefix)
 
-def read_json_if_ready(path: str):            # Helper to safely read JSON if the file is present and parseable
+
+def read_json_if_ready(path: str):            # Helper to safely read the JSON bytes if the file is present
     """
-    Read JSON safely. If the file is empty or being written, we may hit JSONDecodeError.
-    Return (data_dict | None).
+    Read the raw JSON bytes the PSM wrote, without parsing them.
+    The PSM writes atomically (temp file + rename), so we never see a half-written file.
+    Return ((raw_bytes, xxh3_64 digest) | None).
     """
-    try:                                      # Guard against concurrent write or empty file
-        if not os.path.exists(path) or os.path.getsize(path) == 0:  # If file missing or empty, treat as no data
-            return None                        # Caller will skip this cycle
-        with open(path, "r") as f:            # Open the output file produced by the PSM
-            return json.load(f)               # Parse and return JSON as a Python dict
-    except json.JSONDecodeError:              # If we catch a partial write (shouldn’t happen with atomic writes), skip
-        # The PSM writes atomically, but if something else writes non-atomically,
-        # we'll just skip this cycle and try again.
-        return None                           # Try again next poll
+    try:                                      # Guard against a missing file or IO errors
+        with open(path, "rb") as f:           # Open the output file produced by the PSM (bytes)
+            raw = f.read()                    # One read; these snapshots are tiny
+    except FileNotFoundError:                 # PSM hasn't written anything yet
+        return None                           # Try again on the next change
     except Exception as e:                    # Any other exception: log and skip
-        print(f"[output-bridge] ERROR reading {path}: {e}")  # Log the error for diagnosis
+        log.error("Failed reading %s: %s", path, e)  # Log the error for diagnosis
         return None                           # Return no data so main loop won’t publish
+    if not raw:                               # Empty file: treat as no data
+        return None                           # Caller will skip this cycle
+    return raw, xxhash.xxh3_64_intdigest(raw) # Bytes to publish + cheap fingerprint for change detection
 
 
+def setup_logging() -> logging.handlers.QueueListener:     # Route all logging through a queue drained by a background thread
+    """
+    QueueHandler still formats each record on the calling thread; only the blocking
+    stderr write moves to the QueueListener thread. The main saving is that DEBUG
+    records (one per publish) are dropped before formatting at LOG_LEVEL = INFO.
+    Returns the started listener; call .stop() on exit to flush pending records.
+    """
+    log_queue = queue.Queue(-1)                               # Unbounded queue: callers never block on logging
+    root = logging.getLogger()                                # Configure the root logger for the whole process
+    root.setLevel(LOG_LEVEL)                                  # Records below this level are dropped before formatting
+    root.addHandler(logging.handlers.QueueHandler(log_queue)) # Callers format the record and enqueue it
+    stream = logging.StreamHandler()                          # The listener thread writes to stderr
+    stream.setFormatter(logging.Formatter("[%(name)s] %(levelname)s: %(message)s"))  # Same "[bridge] ..." prefix as before
+    listener = logging.handlers.QueueListener(log_queue, stream)  # Background thread draining the queue
+    listener.start()                                          # Start it now
+    return listener
 
-def main():                                   # Entrypoint for the output bridge
-    client = mqtt.Client()                    # Create MQTT client
-    client.connect(MQTT_HOST, MQTT_PORT, keepalive=60)      # Connect to broker (keepalive for heartbeats)
-    client.loop_start()                       # Start MQTT network loop in background so our polling loop can run
-    print(f"[output-bridge] Connected to MQTT broker at {MQTT_HOST}:{MQTT_PORT}")  # Log successful connection
-
-    previous_payload = None                   # Track last published JSON string so we only publish on changes
-
-    try:                                      # Main polling loop
-        while True:                           # Run forever until interrupted
-            data = read_json_if_ready(OUTPUT_PATH)          # Read the latest outputs from PSM if available
-            if data is not None:              # If we have a valid dict,
-                # Normalize to a canonical string so dict key order doesn't cause false positives
-                current_payload = json.dumps(data, separators=(",", ":"), sort_keys=True)  # Canonicalize JSON for comparison
-                if current_payload != previous_payload:     # Publish only if the content actually changed
-                    client.publish(MQTT_TOPIC, current_payload, qos=0, retain=False)  # Send to plc/output
-                    previous_payload = current_payload       # Update last published snapshot
-                    print(f"[output-bridge] Published change to {MQTT_TOPIC}: {current_payload}")  # Log publication
-            time.sleep(POLL_INTERVAL_SEC)     # Sleep a bit before polling again (prevents busy-wait)
 
-    except KeyboardInterrupt:                 # Allow Ctrl+C to exit gracefully during manual runs
-        print("[output-bridge] Stopping...")  # Log that we’re stopping
+def open_shm() -> shared_memory.SharedMemory: # Create-or-attach the IO segment shared with the PSM ("shm")
+    """
+    The segment is never unlinked, so the PSM and the bridges can each restart
+    independently and keep mapping the same memory.
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=SHM_NAME, create=True, size=SHM_SIZE)  # First one up creates it (zero-filled)
+    except FileExistsError:                   # Already created by the PSM or an earlier run
+        shm = shared_memory.SharedMemory(name=SHM_NAME)     # Attach to it
+    resource_tracker.unregister(shm._name, "shared_memory") # Stop Python from unlinking it when this process exits
+    return shm
+
+
+def read_shm_if_ready(shm: shared_memory.SharedMemory):  # "shm" counterpart of read_json_if_ready()
+    """
+    Seqlock read of the output bitmap. Return ((json_bytes, digest) | None); None when the
+    PSM hasn't published yet or is mid-update (its next semaphore release wakes us again).
+    """
+    buf = shm.buf                             # Shared memory view
+    seq = _U64.unpack_from(buf, _OUT_SEQ)[0]  # Current output version
+    if seq == 0 or seq & 1:                   # Never written, or the PSM is writing right now
+        return None                           # Skip this wakeup
+    bits = _U64.unpack_from(buf, _OUT_BITS)[0]              # Read the bitmap...
+    schema = _U64.unpack_from(buf, _OUT_SCHEMA)[0]          # ...and the ordering id
+    if _U64.unpack_from(buf, _OUT_SEQ)[0] != seq:           # Rewritten meanwhile: torn read
+        return None                           # The PSM's release for that write wakes us again
+    raw = b'{"bits":"%x","schema":"%08x"}' % (bits, schema) # Same canonical JSON the PSM writes in "file" mode
+    return raw, xxhash.xxh3_64_intdigest(raw) # Bytes to publish + fingerprint for change detection
+
+
+def _acquire_or_timeout(sem) -> bool:        # Blocking semaphore wait, run in a worker thread ("shm")
+    import posix_ipc                          # Already loaded by run(); only "shm" needs the package
+    try:
+        sem.acquire(SEM_WAIT_TIMEOUT_SEC)     # Wait for the PSM's release (bounded, so the thread can exit on shutdown)
+        return True                           # The PSM signalled a change
+    except posix_ipc.BusyError:               # Timed out: nothing changed
+        return False
+
+
+async def wait_shm_outputs(sem):              # Async generator that wakes the main loop on every PSM output change ("shm")
+    """
+    Yield once right away (publish the current snapshot), then once per semaphore release.
+    POSIX semaphores have no file descriptor the event loop could watch, so the wait
+    itself runs in a worker thread; the event loop stays free for MQTT meanwhile.
+    """
+    yield None                                # Initial check before waiting
+    while True:                               # Forever
+        if await asyncio.to_thread(_acquire_or_timeout, sem):  # Block (in a thread) until the PSM signals a change
+            yield None                        # Let the main loop read and publish
 
-    finally:                                  # Always clean up MQTT background loop
-        client.loop_stop()                    # Stop the Paho background network loop
-        client.disconnect()                   # Disconnect from the broker
+
+def open_inotify(directory: str) -> int:    # Non-blocking inotify fd watching `directory` for finished writes
+    """
+    Return an inotify file descriptor reporting files renamed into (or closed after writing in)
+    `directory`. It is non-blocking so the event loop can drain it from an add_reader callback.
+    """
+    libc = ctypes.CDLL(None, use_errno=True)  # libc is already loaded into the process
+    fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)   # IN_NONBLOCK / IN_CLOEXEC share the O_* values
+    if fd < 0:                                # Out of inotify instances, etc.
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    if libc.inotify_add_watch(fd, os.fsencode(directory), IN_MOVED_TO | IN_CLOSE_WRITE) < 0:  # Watch the directory itself
+        err = ctypes.get_errno()
+        os.close(fd)                          # Don't leak the instance
+        raise OSError(err, os.strerror(err), directory)
+    return fd
+
+
+def inotify_names(data: bytes):               # File names carried by a buffer of inotify events
+    offset = 0                                # Events are packed back to back
+    while offset < len(data):
+        _, _, _, length = _INOTIFY_EVENT.unpack_from(data, offset)  # Only the name length matters here
+        offset += _INOTIFY_EVENT.size         # Skip to the name
+        yield data[offset:offset + length].rstrip(b"\0")  # The name is NUL-padded to `length`
+        offset += length                      # Next event
+
+
+async def watch_output(path: str):            # Async generator that wakes the main loop only when output.json is replaced
+    """
+    Yield once right away (publish the current snapshot), then once per change.
+    The PSM writes via rename, which swaps the file's inode, so we watch the parent
+    directory and filter on the file name instead of the file itself. The inotify fd is
+    polled by the event loop: no thread, no timer, so the bridge sleeps until the kernel
+    reports an event and reacts within milliseconds.
+    """
+    directory, name = os.path.split(os.path.abspath(path))  # Watch /tmp itself...
+    name = os.fsencode(name)                  # ...but only care about output.json
+    fd = open_inotify(directory)              # Kernel queue of events for the directory
+    changed = asyncio.Event()                 # Set by the reader callback, consumed below
+    loop = asyncio.get_running_loop()
+
+    def on_readable():                        # Runs on the event loop whenever the fd has events
+        try:
+            data = os.read(fd, 4096)          # Drain a batch (the loop calls us again if more are pending)
+        except BlockingIOError:               # Spurious wakeup: nothing to read
+            return
+        if name in inotify_names(data):       # Ignore other files in /tmp (and our own .tmp file)
+            changed.set()                     # Several events before we run collapse into one wakeup
+
+    loop.add_reader(fd, on_readable)          # Let the event loop's epoll watch the fd
+    try:
+        yield None                            # Initial check before waiting for any change
+        while True:                           # Forever
+            await changed.wait()              # Sleep until output.json was replaced
+            changed.clear()                   # Re-arm before reading, so a change during the read isn't lost
+            yield None                        # Let the main loop read and publish
+    finally:
+        loop.remove_reader(fd)                # Stop watching when the connection (and this generator) ends
+        os.close(fd)                          # Release the inotify instance
+
+
+async def run():                              # The whole bridge as one coroutine
+    """
+    Connect, publish the current snapshot, then publish on every change. aiomqtt does not
+    reconnect by itself: a dropped connection surfaces as MqttError on the next publish,
+    and this loop then reconnects and starts over, republishing the current snapshot.
+    """
+    if IO_TRANSPORT == "shm":                 # Shared memory: wake on the PSM's semaphore, read the bitmap
+        import posix_ipc                      # Imported here: the "file" transport doesn't need the package
+        shm = open_shm()                      # Map the segment
+        sem = posix_ipc.Semaphore(SHM_OUTPUT_SEM, posix_ipc.O_CREAT)  # Create-or-open the wakeup semaphore
+        make_wakeups = lambda: wait_shm_outputs(sem)        # One wakeup per output change
+        read_snapshot = lambda: read_shm_if_ready(shm)      # Bitmap → JSON bytes
+    else:                                     # File: wake on inotify, read output.json
+        make_wakeups = lambda: watch_output(OUTPUT_PATH)    # One wakeup per file change
+        read_snapshot = lambda: read_json_if_ready(OUTPUT_PATH)  # Raw file bytes
+
+    while True:                               # Reconnect loop
+        try:
+            async with aiomqtt.Client(        # Connect to broker; the client lives on this event loop
+                MQTT_HOST,
+                MQTT_PORT,
+                keepalive=60,                 # Heartbeats are sent by the event loop, no extra thread
+                protocol=aiomqtt.ProtocolVersion.V5,  # Speak MQTT 5 to the broker
+            ) as client:
+                log.info("Connected to MQTT broker at %s:%s", MQTT_HOST, MQTT_PORT)  # Log successful connection
+                previous_hash = None          # Fingerprint of the last published bytes so we only publish on changes
+                async with contextlib.aclosing(make_wakeups()) as wakeups:  # Close the watcher if the connection drops
+                    async for _ in wakeups:   # Run forever, waking only when the outputs change
+                        snapshot = read_snapshot()        # Read the latest output bytes from PSM if available (tiny, non-blocking in practice)
+                        if snapshot is not None:          # If there was content,
+                            raw, current_hash = snapshot  # Unpack bytes + fingerprint
+                            if current_hash != previous_hash:  # Publish only if the content actually changed
+                                await client.publish(MQTT_TOPIC, raw, qos=0, retain=False)  # Send the PSM's bytes verbatim to plc/output
+                                previous_hash = current_hash  # Update last published fingerprint
+                                log.debug("Published change to %s: %s", MQTT_TOPIC, raw)  # Log publication (formatted only at DEBUG)
+        except aiomqtt.MqttError as e:        # Broker unreachable or connection lost
+            log.warning("MQTT connection lost (%s); reconnecting in %s s", e, RECONNECT_DELAY_SEC)  # Tell the operator
+            await asyncio.sleep(RECONNECT_DELAY_SEC)        # Back off before trying again
+
+
+def main():                                   # Entrypoint for the output bridge
+    listener = setup_logging()                # Start the background logging thread first
+    try:
+        asyncio.run(run())                    # Run the event loop until interrupted
+    except KeyboardInterrupt:                 # Allow Ctrl+C to exit gracefully during manual runs
+        log.info("Stopping...")               # Log that we’re stopping
+    finally:
+        listener.stop()                       # Flush any queued log records
 
 
 
@@ -73,6 +257,7 @@ if __name__ == "__main__":                    # Standard Python script guard
     main()                                    # Invoke main when run directly
 
 # HOW THIS FILE RELATES TO THE OTHERS:
-# - CONSUMES /tmp/output.json written by hardware_layer.py (PSM).
+# - CONSUMES /tmp/output.json written by hardware_layer.py (PSM)
+#   (or, with IO_TRANSPORT = "shm", the output bitmap in the "plc_io" shared-memory segment).
 # - PUBLISHES to MQTT topic plc/output so tools like Node-RED can subscribe and react.
 # - Completes the loop started by mqtt_input_bridge.py → PSM → here → MQTT out.